@@ -24,20 +24,42 @@ import os, os.path
 import sys
 import re
 import math
+import mmap
 import tempfile
 import time
-import toml
 import shlex
 import shutil
 import hashlib
+import heapq
 import argparse
+import concurrent.futures
+import functools
 import subprocess
 import statistics
 
+# tomllib is only available from Python 3.11, and cannot write config files
+try:
+    import tomllib
+except ImportError:
+    tomllib = None
+try:
+    import toml
+except ImportError:
+    toml = None
+
+# Hashes are only compared against each other, so use the fastest hasher available
+try:
+    from blake3 import blake3 as hasher
+except ImportError:
+    hasher = hashlib.sha1
+
 # Simple usleep function
 usleep = lambda x: time.sleep(x/1000000.0)
 
-BUF_SIZE = 1024*1024  # lets read stuff in 1MB chunks when hashing or copying
+BUF_SIZE = 1024*1024  # lets read stuff in 1MB chunks when it cannot be mmapped or copied by the kernel
+
+# Hashes of testfiles, keyed by (path, size, mtime_ns)
+hashcache = dict()
 
 # ANSI color codes
 BLUE = '\033[34m'
@@ -47,29 +69,22 @@ BRIGHT = '\033[1m'
 DIM = '\033[2m'
 RESET = '\033[0m'
 
-strip_ANSI_regex = re.compile(r"""
-    \x1b     # literal ESC
-    \[       # literal [
-    [;\d]*   # zero or more digits or semicolons
-    [A-Za-z] # a letter
-    """, re.VERBOSE).sub
-
-def get_len(s):
-    ''' Return string length excluding ANSI escape strings '''
-    return len(strip_ANSI_regex("", s))
+# Matches the user cputime line in perf stat output
+perf_time_regex = re.compile(rb'^\s*([\d.,]+)\s+seconds user', re.MULTILINE)
 
-def padstr(instr, length, left=False):
-    ''' Build string pad to length '''
-    padstr = ' ' * (length - get_len(instr))
+def padstr(instr, visiblelen, length, left=False):
+    ''' Build string pad to length, visiblelen is the length of instr excluding ANSI escape strings '''
+    padstr = ' ' * (length - visiblelen)
     return f"{padstr}{instr}" if not left else f"{instr}{padstr}"
 
 def resultstr(result,totlen):
     ''' Build result string and pad to totlen'''
+    plain = f"{result['mintime']:.3f}/{result['avgtime']:.3f}/{result['maxtime']:.3f}/{result['stddev']:.3f}"
     tmpr = ( f"{BLUE}{result['mintime']:.3f}{RESET}"
              f"/{GREEN}{result['avgtime']:.3f}{RESET}"
              f"/{RED}{result['maxtime']:.3f}{RESET}"
              f"/{BRIGHT}{result['stddev']:.3f}{RESET}" )
-    return padstr(tmpr, totlen)
+    return padstr(tmpr, len(plain), totlen)
 
 def printnn(text):
     ''' Print without causing a newline '''
@@ -133,11 +148,18 @@ def defconfig():
 
 def parseconfig(file):
     ''' Parse config file '''
-    config = toml.load(file)
-    return config
+    with open(file, 'rb') as f:
+        data = f.read().decode()
+    if tomllib:
+        return tomllib.loads(data)
+    if not toml:
+        sys.exit("Error, reading config files requires Python 3.11+ or the 'toml' module")
+    return toml.loads(data)
 
 def writeconfig(file):
     ''' Write default config to file '''
+    if not toml:
+        sys.exit("Error, writing config files requires the 'toml' module")
     config = defconfig()
     with open(file, 'w') as f:
         toml.dump(config,f)
@@ -176,6 +198,7 @@ def cputweak(enable):
             runcommand(f"sudo /usr/bin/cpupower frequency-set --min {cfgTuning['cpu_std_minspeed']*1000} --max {cfgTuning['cpu_std_maxspeed']*1000}")
             runcommand('sudo /usr/bin/cpupower idle-set -E')
 
+@functools.lru_cache(maxsize=None)
 def findfile(filename,fatal=True):
     ''' Search for filename in CWD, homedir and deflatebench.py-dir '''
     filepath = os.path.dirname(os.path.realpath(__file__))
@@ -194,49 +217,124 @@ def findfile(filename,fatal=True):
         sys.exit(1)
     return None
 
-def hashfile(file):
-    ''' Calculate hash of file '''
-    sha1 = hashlib.sha1()
+def hashfile(file, cached=False):
+    ''' Calculate hash of file, optionally reusing an earlier result for an unchanged file '''
+    if cached:
+        st = os.stat(file)
+        key = (os.path.realpath(file), st.st_size, st.st_mtime_ns)
+        if key not in hashcache:
+            hashcache[key] = hashfile(file)
+        return hashcache[key]
 
     with open(file, 'rb') as f:
-        while True:
-            data = f.read(BUF_SIZE)
-            if not data:
-                break
-            sha1.update(data)
-    return sha1.hexdigest()
+        # Python 3.11+ does the read loop for us using a reusable buffer
+        if hasattr(hashlib, 'file_digest'):
+            return hashlib.file_digest(f, hasher).hexdigest()
+
+        h = hasher()
+        try:
+            # Hash the whole file in one go, avoids allocating a bytes object per chunk
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                h.update(memoryview(mm))
+        except (ValueError, OSError):
+            # Empty files and special files cannot be mmapped
+            while True:
+                data = f.read(BUF_SIZE)
+                if not data:
+                    break
+                h.update(data)
+    return h.hexdigest()
+
+def availram():
+    ''' Return available physical memory in bytes, or 0 if unknown '''
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_AVAIL_PHYS_PAGES')
+    except (AttributeError, ValueError, OSError):
+        return 0
 
 def generate_testfile(sourcefile,destfile,minsize):
-    ''' Make tempfiles that are concatenated repeatedly until the file is big enough '''
+    ''' Make tempfiles that are concatenated repeatedly until the file is big enough, returns the resulting size '''
     srcsize = os.path.getsize(sourcefile)
     count = math.ceil((minsize*1024*1024)/srcsize)
     dstsize = srcsize*count
 
-    dst = open(destfile, "wb")
-    with open(sourcefile, 'rb') as src:
-        while os.path.getsize(destfile) < dstsize:
-            data = src.read(BUF_SIZE)
-            if not data:
+    # Read the source file once and write it repeatedly, if it comfortably fits in RAM
+    if srcsize <= availram()/4:
+        with open(sourcefile, 'rb') as src:
+            blob = src.read()
+        with open(destfile, 'wb') as dst:
+            for _ in range(count):
+                dst.write(blob)
+        return dstsize
+
+    with open(sourcefile, 'rb') as src, open(destfile, 'wb') as dst:
+        for _ in range(count):
+            if sys.platform.startswith('linux'):
+                # Let the kernel copy the data, sendfile may do short writes.
+                # Other platforms either lack sendfile or require a socket as output.
+                offset = 0
+                while offset < srcsize:
+                    sent = os.sendfile(dst.fileno(), src.fileno(), offset, srcsize - offset)
+                    if sent == 0:
+                        sys.exit(f"Failed, '{sourcefile}' ended after {offset} of {srcsize} bytes while generating '{destfile}'")
+                    offset += sent
+            else:
                 src.seek(0)
-                continue
-            dst.write(data)
-    dst.close()
+                shutil.copyfileobj(src, dst, length=16*1024*1024)
+    return dstsize
+
+def countbytes(f):
+    ''' Read f until EOF and return the number of bytes read '''
+    size = 0
+    while True:
+        data = f.read(BUF_SIZE)
+        if not data:
+            break
+        size += len(data)
+    return size
+
+def spawn(args, env, output, **sp_args):
+    ''' Run args with stdout written to output, returns the finished process and the output size.
+        If output is None, stdout is discarded and its size is counted, otherwise the size is None. '''
+    outsize = None
+    if output is None:
+        with subprocess.Popen(args,env=env,stdout=subprocess.PIPE,**sp_args) as proc:
+            outsize = countbytes(proc.stdout)
+    elif output == os.devnull:
+        with subprocess.Popen(args,env=env,stdout=subprocess.DEVNULL,**sp_args) as proc:
+            pass
+    else:
+        with open(output, 'wb') as outfile, subprocess.Popen(args,env=env,stdout=outfile,**sp_args) as proc:
+            pass
+    return proc, outsize
 
-def runcommand(command, env=None, stoponfail=1, silent=1, output=os.devnull):
-    ''' Run command, and handle special cases '''
+def runcommand_sized(command, env=None, stoponfail=1, silent=1, output=os.devnull, pass_fds=()):
+    ''' Run command given as string or argument list, and handle special cases.
+        Returns retval, and the number of bytes written to stdout if output is None. '''
     env = env if env else None
-    args = shlex.split(command, posix=sys.platform != 'win32')
+    if isinstance(command, str):
+        args = shlex.split(command, posix=sys.platform != 'win32')
+    else:
+        args = command
+        command = ' '.join(args)
     sp_args = {}
     if sys.platform == 'win32':
         sp_args['creationflags'] = subprocess.HIGH_PRIORITY_CLASS
+    if pass_fds:
+        sp_args['pass_fds'] = pass_fds
+    outsize = None
     if silent == 1:
-        devnull = open(output, 'w')
-        retval = subprocess.call(args,env=env,stdout=devnull,**sp_args)
-        devnull.close()
+        proc, outsize = spawn(args, env, output, **sp_args)
+        retval = proc.returncode
     else:
-        retval = subprocess.call(args,env=env,**sp_args)
+        retval = subprocess.run(args,env=env,check=False,**sp_args).returncode
     if (retval != 0) and (stoponfail != 0):
         sys.exit(f"Failed, retval({retval}): {command}")
+    return retval, outsize
+
+def runcommand(command, env=None, stoponfail=1, silent=1, output=os.devnull, pass_fds=()):
+    ''' Run command given as string or argument list, and handle special cases '''
+    retval, _ = runcommand_sized(command, env, stoponfail, silent, output, pass_fds)
     return retval
 
 def get_env(bench=False):
@@ -246,73 +344,112 @@ def get_env(bench=False):
         env['LD_PRELOAD'] = '/usr/lib64/nosync/nosync.so'
     return env
 
-def command_prefix(filen):
-    ''' Build the benchmarking command prefix '''
+def command_prefix(target):
+    ''' Build the benchmarking command prefix as argument list.
+        Target is the file descriptor perf logs to, or the filename time writes to. '''
     if cfgTuning['use_chrt']:
-        command = "/usr/bin/chrt -f 99"
+        command = ['/usr/bin/chrt', '-f', '99']
     else:
-        command = "/usr/bin/nice -n -20"
+        command = ['/usr/bin/nice', '-n', '-20']
 
     if cfgConfig['use_perf']:
-        command += f" /usr/bin/perf stat -D {cfgConfig['start_delay']} -e cpu-clock:u -o '{filen}' -- "
+        command += ['/usr/bin/perf', 'stat', '-D', str(cfgConfig['start_delay']), '-e', 'cpu-clock:u', '--log-fd', str(target), '--']
     else:
-        timeformat="%U"
-        command += f" -20 /usr/bin/time -o {timefile} -f '{timeformat}' -- "
+        command += ['/usr/bin/time', '-o', target, '-f', '%U', '--']
 
     return command
 
+def parse_perfstat(data):
+    ''' Parse output from perf '''
+    m = perf_time_regex.search(data)
+    if m:
+        # Some locales make perf use comma as decimal separator
+        return float(m.group(1).replace(b',', b'.'))
+    return 0.0
+
 def parse_timefile(filen):
-    ''' Parse output from perf or time '''
+    ''' Parse output from time '''
+    with open(filen) as f:
+        content = f.readlines()
+    return float(content[0])
+
+def runtimed_win32(args, env, output):
+    ''' Run benchmark command and return the user cputime of the child process as reported by Windows,
+        and the output size if output is None '''
+    import ctypes
+    from ctypes import wintypes
+
+    # An empty env would start the child without SystemRoot and PATH
+    env = env or None
+    proc, outsize = spawn(args, env, output, creationflags=subprocess.HIGH_PRIORITY_CLASS)
+    retval = proc.returncode
+    if retval != 0:
+        sys.exit(f"Failed, retval({retval}): {' '.join(args)}")
+
+    # Process handle stays valid until proc is garbage collected
+    creation, exited, kernel, user = [wintypes.FILETIME() for _ in range(4)]
+    if not ctypes.windll.kernel32.GetProcessTimes(wintypes.HANDLE(int(proc._handle)), ctypes.byref(creation),
+                                                  ctypes.byref(exited), ctypes.byref(kernel), ctypes.byref(user)):
+        raise ctypes.WinError()
+
+    # FILETIME counts in 100ns units
+    return ((user.dwHighDateTime << 32) | user.dwLowDateTime) / 10000000, outsize
+
+def runtimed(args, env, output):
+    ''' Run benchmark command and return the measured cputime, and the output size if output is None '''
+    if sys.platform == 'win32':
+        return runtimed_win32(args, env, output)
+
     if cfgConfig['use_perf']:
-        with open(filen) as f:
-            content = f.readlines()
-        for line in content:
-            if line[-13:-1] == 'seconds user':
-                return float(line[:-13])
-        return 0.0
+        # Let perf log to a pipe, avoids writing and reading back a timefile
+        rfd, wfd = os.pipe()
+        try:
+            _, outsize = runcommand_sized(command_prefix(wfd) + args, env=env, output=output, pass_fds=(wfd,))
+        finally:
+            os.close(wfd)
+        with open(rfd, 'rb') as f:
+            cputime = parse_perfstat(f.read())
     else:
-        with open(filen) as f:
-            content = f.readlines()
-        return float(content[0])
+        _, outsize = runcommand_sized(command_prefix(timefile) + args, env=env, output=output)
+        cputime = parse_timefile(timefile)
 
-def runtest(tempfiles,level):
-    ''' Run benchmark and tests for current compression level'''
-    hashfail, decomptime = 0,0
+    return cputime, outsize
+
+def verifytest(gzfile, rawfile):
+    ''' Decompress gzfile using gunzip and return the hash of the result '''
+    runcommand(['gunzip', '-c', gzfile], output=rawfile)
+    gziphash = hashfile(rawfile)
+
+    os.unlink(rawfile)
+    os.unlink(gzfile)
+    return gziphash
+
+def runtest(tempfiles,level,verifier):
+    ''' Run benchmark and tests for current compression level.
+        The gunzip verification is submitted to verifier, and its future returned, resolving to the hash. '''
+    hashfail, decomptime, verify = 0,0,None
     testfile = tempfiles[level]['filename']
     orighash = tempfiles[level]['hash']
-    cmdprefix = ''
 
     env = get_env(True)
 
     sys.stdout.write(f"Testing level {level}: ")
-    if sys.platform != 'win32':
-        cmdprefix = command_prefix(timefile)
-        runcommand('sync')
 
     # Compress
     printnn('c')
     usleep(10)
-    starttime = time.perf_counter()
-    testtool = os.path.realpath(cfgRuns['testtool'])
-
-    runcommand(f"{cmdprefix} {testtool} -{level} -c {testfile}", env=env, output=compfile)
-    if sys.platform != 'win32':
-        comptime = parse_timefile(timefile)
+    if cfgConfig['skipdecomp'] and cfgConfig['skipverify']:
+        # Compressed data is not used, so only count its size instead of writing it to disk
+        comptime, compsize = runtimed([testtool, f"-{level}", '-c', testfile], env, None)
     else:
-        comptime = time.perf_counter() - starttime
-    compsize = os.path.getsize(compfile)
+        comptime, _ = runtimed([testtool, f"-{level}", '-c', testfile], env, compfile)
+        compsize = os.stat(compfile).st_size
 
     # Decompress
     if not cfgConfig['skipdecomp'] or not cfgConfig['skipverify']:
         printnn('d')
         usleep(10)
-        starttime = time.perf_counter()
-        runcommand(f"{cmdprefix} {testtool} -d -c {compfile}", env=env, output=decompfile)
-
-        if sys.platform != 'win32':
-            decomptime = parse_timefile(timefile)
-        else:
-            decomptime = time.perf_counter() - starttime
+        decomptime, _ = runtimed([testtool, '-d', '-c', compfile], env, decompfile)
 
         if not cfgConfig['skipverify']:
             ourhash = hashfile(decompfile)
@@ -322,54 +459,50 @@ def runtest(tempfiles,level):
 
         os.unlink(decompfile)
 
-    # Validate using gunzip
+    # Validate using gunzip, only done on the first run since skipverify gets set for later runs
+    # Runs in the background while the next level is tested. It competes with the measured process for
+    # shared cache, memory bandwidth and turbo headroom, so first run timings may be slightly worse.
     if not cfgConfig['skipverify']:
         printnn('v')
-        runcommand(f"gunzip -c {compfile}", output=decompfile)
-
-        gziphash = hashfile(decompfile)
-        if gziphash != orighash:
-            print(f"{orighash} != {gziphash}")
-            hashfail = 1
-
-        os.unlink(decompfile)
+        gzfile = f"{compfile}.{level}"
+        os.replace(compfile, gzfile)
+        verify = verifier.submit(verifytest, gzfile, f"{decompfile}.{level}")
 
     if os.path.exists(timefile):
         os.unlink(timefile)
-    os.unlink(compfile)
+    if os.path.exists(compfile):
+        os.unlink(compfile)
 
     comppct = float(compsize*100)/tempfiles[level]['origsize']
     printnn(f" {comptime:7.3f} {decomptime:7.3f} {compsize:15,} {comppct:7.3f}%")
     printnn('\n')
 
-    return compsize,comptime,decomptime,hashfail
+    return compsize,comptime,decomptime,hashfail,verify
 
 def trimworst(results):
-    ''' Trim X worst results '''
-    results.sort()
-    if not cfgRuns['trimworst']:
-        return results
-    return results[:-cfgRuns['trimworst']]
+    ''' Trim X worst results, returns the remaining results sorted '''
+    return heapq.nsmallest(len(results) - cfgRuns['trimworst'], results)
 
 def getlevels():
-    levels = list(range(cfgRuns['minlevel'],cfgRuns['maxlevel']+1))
+    ''' Build tuple of level names to test, numeric levels followed by strategies '''
+    names = [str(level) for level in range(cfgRuns['minlevel'],cfgRuns['maxlevel']+1)]
     for strategy in cfgRuns['strategies']:
-        levels.append(strategy)
-    return levels
+        names.append(strategy)
+    return tuple(names)
 
 def calculate(results, tempfiles):
     ''' Calculate benchmark results '''
-    totsize, totsize2 = [0]*2
+    totsize = 0
     totcomppct, totcomppct2 = [0]*2
     totcomptime, totcomptime2 = [0]*2
     totdecomptime, totdecomptime2 = [0]*2
     res_comp, res_decomp, res_totals = dict(), dict(), dict()
 
     numresults = cfgRuns['runs'] - cfgRuns['trimworst']
-    numlevels = len(getlevels())
+    numlevels = len(levels)
 
     # Calculate and print stats per level
-    for level in map(str, getlevels()):
+    for level in levels:
         origsize = tempfiles[level]['origsize']
         comp, decomp = dict(), dict()
 
@@ -391,8 +524,8 @@ def calculate(results, tempfiles):
         decomptimes = trimworst(rawdecomptimes)
 
         # Compute averages
-        comp['avgtime']   = statistics.mean(comptimes)
-        decomp['avgtime'] = statistics.mean(decomptimes)
+        comp['avgtime']   = statistics.fmean(comptimes)
+        decomp['avgtime'] = statistics.fmean(decomptimes)
         comp['avgpct'] = float(rsize*100)/origsize
 
         # Compute stddev
@@ -403,11 +536,11 @@ def calculate(results, tempfiles):
             comp['stddev']   = 0
             decomp['stddev'] = 0
 
-        # Calculate min/max and sum for this level
-        comp['mintime']   = min(comptimes)
-        comp['maxtime']   = max(comptimes)
-        decomp['mintime'] = min(decomptimes)
-        decomp['maxtime'] = max(decomptimes)
+        # Calculate min/max and sum for this level, the trimmed lists are already sorted
+        comp['mintime']   = comptimes[0]
+        comp['maxtime']   = comptimes[-1]
+        decomp['mintime'] = decomptimes[0]
+        decomp['maxtime'] = decomptimes[-1]
 
         # Store values for grand total
         tmp_comptime = sum(comptimes)
@@ -417,8 +550,7 @@ def calculate(results, tempfiles):
         totcomppct += comp['avgpct']
         totcomptime += tmp_comptime
         totdecomptime += tmp_decomptime
-        if level != 0:
-            totsize2 += rsize
+        if level != '0':
             totcomppct2 += comp['avgpct']
             totcomptime2 += tmp_comptime
             totdecomptime2 += tmp_decomptime
@@ -470,7 +602,7 @@ def printreport(comp,decomp,totals):
     else:
         print("\n Level   Comp   Comptime min/avg/max/stddev  Decomptime min/avg/max/stddev  Compressed size")
 
-    for level in map(str, getlevels()):
+    for level in levels:
         # Print level results
         compstr = resultstr(comp[level],28)
         decompstr = ""
@@ -489,16 +621,19 @@ def printreport(comp,decomp,totals):
     else:
         print(f" {'tot':5} {'':8}{totals['totcomptime']:28.3f} {totals['totdecompstr']:>30}  {totals['totsize']:15,}")
 
-def printfile(level,filename):
+def printfile(level,filename,filesize=None):
     ''' Prints formatted information about file '''
-    filesize = os.path.getsize(filename)
+    if filesize is None:
+        filesize = os.path.getsize(filename)
     print(f"Level {level}: {filename} {filesize/1024/1024:6.1f} MiB  {filesize:12,} B")
 
 def benchmain():
     ''' Main benchmarking function '''
-    global timefile, compfile, decompfile
+    global timefile, compfile, decompfile, testtool, levels
 
     print(f"Tool: {cfgRuns['testtool']}")
+    testtool = os.path.realpath(cfgRuns['testtool'])
+    levels = getlevels()
 
     # Prepare tempfiles
     timefile = os.path.join(cfgConfig['temp_path'], 'zlib-time.tmp')
@@ -511,13 +646,19 @@ def benchmain():
     if cfgRuns['testmode'] == 'single':
         tmp_filename = os.path.join(cfgConfig['temp_path'], "deflatebench.tmp")
         srcfile = findfile(cfgSingle['testfile'])
-        shutil.copyfile(srcfile,tmp_filename)
-        tmp_hash = hashfile(tmp_filename)
-        origsize = os.path.getsize(tmp_filename)
+        # The testtool only reads the testfile, so a symlink is enough
+        if os.path.lexists(tmp_filename):
+            os.unlink(tmp_filename)
+        try:
+            os.symlink(srcfile,tmp_filename)
+        except (OSError, NotImplementedError):
+            shutil.copyfile(srcfile,tmp_filename)
+        tmp_hash = hashfile(srcfile)
+        origsize = os.path.getsize(srcfile)
         print("Activated single file mode")
-        printfile(f"{cfgRuns['minlevel']}-{cfgRuns['maxlevel']}", srcfile)
+        printfile(f"{cfgRuns['minlevel']}-{cfgRuns['maxlevel']}", srcfile, origsize)
 
-        for level in map(str, getlevels()):
+        for level in levels:
             tempfiles[level] = dict()
             tempfiles[level]['filename'] = tmp_filename
             tempfiles[level]['hash'] = tmp_hash
@@ -529,7 +670,7 @@ def benchmain():
         else:
             print(f"Activated multiple generated file mode. Source: {cfgGen['srcFile']}")
 
-        for level in map(str, getlevels()):
+        for level in levels:
             tempfiles[level] = dict()
             tmp_filename = os.path.join(cfgConfig['temp_path'], f"deflatebench-{level}.tmp")
             tempfiles[level]['filename'] = tmp_filename
@@ -537,20 +678,25 @@ def benchmain():
             if cfgRuns['testmode'] == 'multi':
                 srcfile = findfile(cfgMulti[level])
                 shutil.copyfile(srcfile,tmp_filename)
-                printfile(f"{level}", srcfile)
+                tempfiles[level]['origsize'] = os.path.getsize(srcfile)
+                printfile(f"{level}", srcfile, tempfiles[level]['origsize'])
+                # Levels often share the same testfile, so hash the source to benefit from the cache
+                tempfiles[level]['hash'] = hashfile(srcfile, cached=True)
             else:
-                generate_testfile(findfile(cfgGen['srcFile']),tmp_filename,cfgGen[level])
-                printfile(f"{level}", tmp_filename)
+                tempfiles[level]['origsize'] = generate_testfile(findfile(cfgGen['srcFile']),tmp_filename,cfgGen[level])
+                printfile(f"{level}", tmp_filename, tempfiles[level]['origsize'])
+                tempfiles[level]['hash'] = hashfile(tmp_filename)
 
-            tempfiles[level]['hash'] = hashfile(tmp_filename)
-            tempfiles[level]['origsize'] = os.path.getsize(tmp_filename)
+    # Flush the freshly written testfiles once, instead of syncing before every test
+    if hasattr(os, 'sync'):
+        os.sync()
 
     # Tweak system to reduce benchmark variance
     cputweak(True)
 
     # Prepare multilevel results array
     results = dict()
-    for level in map(str, getlevels()):
+    for level in levels:
         results[level] = []
 
     # Run tests and record results
@@ -559,11 +705,22 @@ def benchmain():
             cfgConfig['skipverify'] = True
 
         print(f"Starting run {run} of {cfgRuns['runs']}")
-        for level in map(str, getlevels()):
-            compsize,comptime,decomptime,hashfail = runtest(tempfiles,level)
-            if hashfail != 0:
-                print(f"ERROR: level {level} failed crc checking")
-            results[level].append( [compsize,comptime,decomptime] )
+        verifies = dict()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as verifier:
+            for level in levels:
+                compsize,comptime,decomptime,hashfail,verify = runtest(tempfiles,level,verifier)
+                if hashfail != 0:
+                    print(f"ERROR: level {level} failed crc checking")
+                if verify:
+                    verifies[level] = verify
+                results[level].append( [compsize,comptime,decomptime] )
+
+        # Collect results from the background gunzip verification
+        for level, verify in verifies.items():
+            gziphash = verify.result()
+            if gziphash != tempfiles[level]['hash']:
+                print(f"{tempfiles[level]['hash']} != {gziphash}")
+                print(f"ERROR: level {level} failed gunzip verification")
 
     res_comp,res_decomp,res_totals = calculate(results, tempfiles)
     printreport(res_comp,res_decomp,res_totals)
@@ -572,7 +729,7 @@ def benchmain():
     cputweak(False)
 
     # Clean up tempfiles
-    for level in map(str, getlevels()):
+    for level in levels:
         if os.path.isfile(tempfiles[level]['filename']):
             os.unlink(tempfiles[level]['filename'])
 